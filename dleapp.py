@@ -1,16 +1,31 @@
 import json
 import argparse
+import contextlib
 import io
 import os.path
+import sys
 import typing
-import plugin_loader
-import scripts.report as report
 import traceback
 
-from scripts.search_files import *
-from scripts.ilapfuncs import *
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from scripts.version_info import dleapp_version
-from time import process_time, gmtime, strftime, perf_counter
+from time import gmtime, strftime, perf_counter_ns
+
+# The plugin loader, the seekers and the report (and their third party dependencies) are imported
+# in the functions which use them, so that --help and the argument checks start quickly
+if typing.TYPE_CHECKING:
+    import plugin_loader
+
+# orjson is optional, it reads and writes the profile and case data files faster than json
+try:
+    import orjson
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(obj):
+        return json.dumps(obj).encode('utf-8')
+    json_loads = json.loads
 
 def validate_args(args):
     if args.artifact_paths or args.create_profile_casedata:
@@ -37,10 +52,38 @@ def validate_args(args):
         raise argparse.ArgumentError(None, 'DLEAPP Profile file not found! Run the program again.')
         
 
+@contextlib.contextmanager
+def _module_name_completion(module_names):
+    '''Completes module names with the Tab key, only while typing the modules to add or remove'''
+    try:
+        import readline
+    except ImportError:
+        yield  # readline is not available on Windows
+        return
+
+    def complete_module_name(text, state):
+        matches = [module_name for module_name in module_names if module_name.startswith(text)]
+        return matches[state] if state < len(matches) else None
+
+    old_completer = readline.get_completer()
+    old_delims = readline.get_completer_delims()
+    readline.set_completer_delims(', ')
+    readline.set_completer(complete_module_name)
+    readline.parse_and_bind('tab: complete')
+    try:
+        yield
+    finally:
+        readline.set_completer(old_completer)
+        readline.set_completer_delims(old_delims)
+
 def create_profile(plugins, path):
     available_modules = [(module_data.category, module_data.name) for module_data in plugins]
     available_modules.sort()
-    modules_in_profile = {}
+    # the module list is only formatted once, for the 'l' and 'p' choices
+    available_modules_lines = [f'{number} {available_module}\n'
+                               for number, available_module in enumerate(available_modules, 1)]
+    module_numbers = {module_name: number for number, (_, module_name) in enumerate(available_modules, 1)}
+    modules_in_profile = set()  # numbers of the modules added to the profile
 
     user_choice = ''
     print('--- DLEAPP Profile file creation ---\n')
@@ -55,48 +98,50 @@ def create_profile(plugins, path):
         print()
         if user_choice == "l":
             print('Available modules:')
-            for number, available_module in enumerate(available_modules):
-                print(number + 1, available_module)
+            sys.stdout.writelines(available_modules_lines)
             print()
             user_choice = ''
         elif user_choice == "p":
             if modules_in_profile:
-                for number, module in modules_in_profile.items():
-                    print(number, module)
+                sys.stdout.writelines(available_modules_lines[number - 1] for number in sorted(modules_in_profile))
                 print()
             else:
                 print('No module added to the profile file\n')
             user_choice = ''
         elif user_choice == 'a':
-            modules_numbers = input('Enter the numbers of modules, seperated by a comma, to add or remove in the profile file: ')
-            modules_numbers = modules_numbers.split(',')
-            modules_numbers = [module_number.strip() for module_number in modules_numbers]
-            for module_number in modules_numbers:
-                if module_number.isdigit():
-                    module_number = int(module_number)
-                    if module_number > 0 and module_number <= len(available_modules):
-                        if module_number not in modules_in_profile:
-                            module_to_add = available_modules[module_number - 1]
-                            modules_in_profile[module_number] = module_to_add
-                            print(f'module number {module_number} {module_to_add} was added')
-                        else:
-                            module_to_remove = modules_in_profile[module_number]
-                            print(f'module number {module_number} {module_to_remove} was removed')
-                            del modules_in_profile[module_number]
+            with _module_name_completion(module_numbers):
+                modules_entered = input('Enter the numbers or names (Tab completes names) of modules, seperated by a comma, '
+                                        'to add or remove in the profile file: ')
+            modules_entered = [module_entered.strip() for module_entered in modules_entered.split(',')]
+            for module_entered in modules_entered:
+                if not module_entered:
+                    continue
+                if module_entered.isdigit():
+                    module_number = int(module_entered)
+                else:
+                    module_number = module_numbers.get(module_entered, 0)
+                if module_number > 0 and module_number <= len(available_modules):
+                    module = available_modules[module_number - 1]
+                    if module_number not in modules_in_profile:
+                        modules_in_profile.add(module_number)
+                        print(f'module number {module_number} {module} was added')
                     else:
-                        print('Please enter the number of a module!!!\n')
+                        modules_in_profile.remove(module_number)
+                        print(f'module number {module_number} {module} was removed')
+                else:
+                    print('Please enter the number or the name of a module!!!\n')
             print()
             user_choice = ''
         elif user_choice == "q":
             if modules_in_profile:
-                modules = [module_info[1] for module_info in modules_in_profile.values()]
+                modules = [available_modules[number - 1][1] for number in sorted(modules_in_profile)]
                 profile_filename = ''
                 while not profile_filename:
                     profile_filename = input('Enter the name of the profile: ')
                 profile_filename += '.dlprofile'
                 filename = os.path.join(path, profile_filename)
-                with open(filename, "wt", encoding="utf-8") as profile_file:
-                    json.dump({"leapp": "dleapp", "format_version": 1, "plugins": modules}, profile_file)
+                with open(filename, "wb") as profile_file:
+                    profile_file.write(json_dumps({"leapp": "dleapp", "format_version": 1, "plugins": modules}))
                 print('\nProfile saved:', filename)
                 print()
             else:
@@ -120,8 +165,8 @@ def create_casedata(path):
         case_data_filename = input('Enter the name of the Case Data file: ')
     case_data_filename += '.lcasedata'
     filename = os.path.join(path, case_data_filename)
-    with open(filename, "wt", encoding="utf-8") as case_data_file:
-        json.dump({"leapp": "case_data", "case_data_values": case_data_values}, case_data_file)
+    with open(filename, "wb") as case_data_file:
+        case_data_file.write(json_dumps({"leapp": "case_data", "case_data_values": case_data_values}))
     print('\nCase Data file saved:', filename)
     print()
     return
@@ -147,13 +192,10 @@ def main():
                         help=("Generate a text file list of artifact paths. "
                               "This argument is meant to be used alone, without any other arguments."))
 
-    loader = plugin_loader.PluginLoader()
-    available_plugins = list(loader.plugins)
     profile_filename = None
+    profile_plugins = None
     casedata = {}
 
-    selected_plugins = available_plugins.copy()
-
     args = parser.parse_args()
 
     try:
@@ -161,18 +203,17 @@ def main():
     except argparse.ArgumentError as e:
         parser.error(str(e))
 
+    import plugin_loader
+
     if args.artifact_paths:
         print('Artifact path list generation started.')
         print('')
+        loader = plugin_loader.PluginLoader()
+        all_paths = [search for plugin in loader.plugins for search in plugin.search_regexes]
+        paths_text = ''.join(path + '\n' for path in all_paths)
         with open('path_list.txt', 'a') as paths:
-            for plugin in loader.plugins:
-                if isinstance(plugin.search, tuple):
-                    for x in plugin.search:
-                        paths.write(x + '\n')
-                        print(x)
-                else:  # TODO check that this is actually a string?
-                    paths.write(plugin.search + '\n')
-                    print(plugin.search)
+            paths.write(paths_text)
+        sys.stdout.write(paths_text)
         print('')
         print('Artifact path list generation completed')
         return
@@ -191,7 +232,7 @@ def main():
                 create_choice = input('Please enter your choice: ').lower()
                 print()
                 if create_choice == '1':
-                    create_profile(available_plugins, args.create_profile_casedata)
+                    create_profile(plugin_loader.PluginLoader().plugins, args.create_profile_casedata)
                     create_choice = ''
                 elif create_choice == '2':
                     create_casedata(args.create_profile_casedata)
@@ -208,9 +249,9 @@ def main():
     if args.load_case_data:
         case_data_filename = args.load_case_data
         case_data_load_error = None
-        with open(case_data_filename, "rt", encoding="utf-8") as case_data_file:
+        with open(case_data_filename, "rb") as case_data_file:
             try:
-                case_data = json.load(case_data_file)
+                case_data = json_loads(case_data_file.read())
             except:
                 case_data_load_error = "File was not a valid case data file: invalid format"
                 print(case_data_load_error)
@@ -233,9 +274,9 @@ def main():
     if args.load_profile:
         profile_filename = args.load_profile
         profile_load_error = None
-        with open(profile_filename, "rt", encoding="utf-8") as profile_file:
+        with open(profile_filename, "rb") as profile_file:
             try:
-                profile = json.load(profile_file)
+                profile = json_loads(profile_file.read())
             except json.JSONDecodeError as json_ex:
                 profile_load_error = f"File was not a valid profile file: {json_ex}"
                 print(profile_load_error)
@@ -249,12 +290,16 @@ def main():
                     return
                 else:
                     profile_plugins = set(profile.get("plugins", []))
-                    selected_plugins = [selected_plugin for selected_plugin in available_plugins 
-                                        if selected_plugin.name in profile_plugins]
             else:
                 profile_load_error = "File was not a valid profile file: invalid format"
                 print(profile_load_error)
                 return
+
+    from scripts.ilapfuncs import OutputParameters, add_long_path_prefix
+
+    # Only the plugins selected by the profile (if any) are kept
+    loader = plugin_loader.PluginLoader()
+    selected_plugins = list(loader.plugins_filtered(names=profile_plugins))
     
     input_path = args.input_path
     extracttype = args.t
@@ -263,24 +308,79 @@ def main():
 
     # File system extractions can contain paths > 260 char, which causes problems
     # This fixes the problem by prefixing \\?\ on each windows path.
-    if is_platform_windows():
-        if input_path[1] == ':' and extracttype =='fs': input_path = '\\\\?\\' + input_path.replace('/', '\\')
-        if output_path[1] == ':': output_path = '\\\\?\\' + output_path.replace('/', '\\')
+    if extracttype == 'fs':
+        input_path = add_long_path_prefix(input_path)
+    output_path = add_long_path_prefix(output_path)
 
     out_params = OutputParameters(output_path)
 
+    crunch_artifacts(selected_plugins, extracttype, input_path, out_params, wrap_text, loader, casedata, profile_filename)
+
+def _process_plugin(plugin, files_found, category_folder, seeker, wrap_text, buffer_logs=False):
+    '''Runs a single plugin on the files found for it.
+    Returns a tuple (plugin name, log entries, status). The log entries are only returned with
+    buffer_logs, everything logged while the plugin runs is then kept instead of written'''
+    from scripts.ilapfuncs import logfunc, start_log_buffering, stop_log_buffering
+
+    if buffer_logs:
+        start_log_buffering()
     try:
-        casedata
-    except NameError:
-        casedata = {}
+        logfunc()
+        logfunc('{} [{}] artifact started'.format(plugin.name, plugin.module_name))
+        try:
+            plugin.method(files_found, category_folder, seeker, wrap_text)
+        except Exception as ex:
+            logfunc('Reading {} artifact had errors!'.format(plugin.name))
+            logfunc('Error was {}'.format(str(ex)))
+            logfunc('Exception Traceback: {}'.format(traceback.format_exc()))
+            status = False
+        else:
+            logfunc('{} [{}] artifact completed'.format(plugin.name, plugin.module_name))
+            status = True
+    finally:
+        log_entries = stop_log_buffering() if buffer_logs else []
+    return plugin.name, log_entries, status
+
+def _run_plugins(plugin_jobs, seeker, wrap_text):
+    '''Yields the result of each (plugin, files_found, category_folder) job as it completes'''
+    from scripts.ilapfuncs import GuiWindow, logfunc
+    from scripts.search_files import FileSeekerDir
+
+    # tkinter widgets (used by logfunc from the GUI) must only be touched from the main thread, and
+    # the archive seekers extract files on search through a shared handle, so run those serially
+    if GuiWindow.window_handle or not isinstance(seeker, FileSeekerDir):
+        for plugin, files_found, category_folder in plugin_jobs:
+            yield _process_plugin(plugin, files_found, category_folder, seeker, wrap_text)
+        return
 
-        crunch_artifacts(selected_plugins, extracttype, input_path, out_params, wrap_text, loader, casedata, profile_filename)
+    # the log of each plugin is kept until it completes, so that it is written as one block
+    executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+    futures = [executor.submit(_process_plugin, plugin, files_found, category_folder, seeker, wrap_text, True)
+               for plugin, files_found, category_folder in plugin_jobs]
+    reported_futures = set()
+    try:
+        for future in as_completed(futures):
+            reported_futures.add(future)
+            yield future.result()
+    except BaseException:
+        # eg: Ctrl-C, drop the plugins not started yet and keep the logs of those which already finished
+        executor.shutdown(wait=False, cancel_futures=True)
+        for future in futures:
+            if future in reported_futures or not future.done() or future.cancelled() or future.exception():
+                continue
+            for log_entry in future.result()[1]:
+                logfunc(log_entry)
+        raise
+    executor.shutdown()
 
 def crunch_artifacts(
-        plugins: typing.Sequence[plugin_loader.PluginSpec], extracttype, input_path, out_params, wrap_text,
-        loader: plugin_loader.PluginLoader, casedata, profile_filename):
-    start = process_time()
-    start_wall = perf_counter()
+        plugins: typing.Sequence['plugin_loader.PluginSpec'], extracttype, input_path, out_params, wrap_text,
+        loader: 'plugin_loader.PluginLoader', casedata, profile_filename):
+    import scripts.report as report
+    from scripts.ilapfuncs import GuiWindow, is_platform_windows, logdevinfo, logfunc, strip_long_path_prefix
+    from scripts.search_files import FileSeekerDir, FileSeekerTar, FileSeekerZip
+
+    start = perf_counter_ns()
  
     logfunc('Processing started. Please wait. This may take a few minutes...')
 
@@ -291,27 +391,36 @@ def crunch_artifacts(
     logfunc('By: Yogesh Khatri   | @SwiftForensics | swiftforensics.com\n')
     logdevinfo()
 
+    if not plugins:
+        logfunc('No plugins selected')
+        return False
+
+    unique_search_regexes = dict.fromkeys(artifact_search_regex for plugin in plugins
+                                          for artifact_search_regex in plugin.search_regexes)
+
+    # Building the seeker can mean reading a whole archive, skip it if there is nothing to search for
     seeker = None
-    try:
-        if extracttype == 'fs':
-            seeker = FileSeekerDir(input_path)
+    if unique_search_regexes:
+        try:
+            if extracttype == 'fs':
+                seeker = FileSeekerDir(input_path)
 
-        elif extracttype in ('tar', 'gz'):
-            seeker = FileSeekerTar(input_path, out_params.temp_folder)
+            elif extracttype in ('tar', 'gz'):
+                seeker = FileSeekerTar(input_path, out_params.temp_folder)
 
-        elif extracttype == 'zip':
-            seeker = FileSeekerZip(input_path, out_params.temp_folder)
+            elif extracttype == 'zip':
+                seeker = FileSeekerZip(input_path, out_params.temp_folder)
 
-        else:
-            logfunc('Error on argument -o (input type)')
+            else:
+                logfunc('Error on argument -o (input type)')
+                return False
+        except Exception as ex:
+            logfunc('Had an exception in Seeker - see details below. Terminating Program!')
+            temp_file = io.StringIO()
+            traceback.print_exc(file=temp_file)
+            logfunc(temp_file.getvalue())
+            temp_file.close()
             return False
-    except Exception as ex:
-        logfunc('Had an exception in Seeker - see details below. Terminating Program!')
-        temp_file = io.StringIO()
-        traceback.print_exc(file=temp_file)
-        logfunc(temp_file.getvalue())
-        temp_file.close()
-        return False
 
     # Now ready to run
     logfunc(f'Info: {len(loader)} modules loaded.')
@@ -321,75 +430,87 @@ def crunch_artifacts(
     logfunc(f'File/Directory selected: {input_path}')
     logfunc('\n--------------------------------------------------------------------------------------')
 
-    log = open(os.path.join(out_params.report_folder_base, 'Script Logs', 'ProcessedFilesLog.html'), 'w+', encoding='utf8')
-    log.write(f'Extraction/Path selected: {input_path}<br><br>')
+    # ProcessedFilesLog.html is built in memory and written once all searches are done
+    log_parts: list[str] = [f'Extraction/Path selected: {input_path}<br><br>']
     
     parsed_modules = 0
-
-    # Search for the files per the arguments
+    # only Windows paths can carry the \\?\ prefix, no need to check each path elsewhere
+    strip_long_paths = is_platform_windows()
+    open_li = '<ul><li>'
+    close_li = '</li></ul>'
+    between_li = close_li + open_li
+
+    # Search for the files per the arguments, once per unique regex as plugins often share them
+    search_results: dict[str, list[str]] = seeker.search_many(unique_search_regexes) if seeker else {}
+
+    category_folders: dict[str, str] = {category: os.path.join(out_params.report_folder_base, category)
+                                        for category in {plugin.category for plugin in plugins}}
+    plugin_jobs = []
     for plugin in plugins:
-        if isinstance(plugin.search, list) or isinstance(plugin.search, tuple):
-            search_regexes = plugin.search
-        else:
-            search_regexes = [plugin.search]
-        parsed_modules += 1
-        GuiWindow.SetProgressBar(parsed_modules, len(plugins))
-        files_found = []
-        log.write(f'<b>For {plugin.name} module</b>')
-        for artifact_search_regex in search_regexes:
-            found = seeker.search(artifact_search_regex)
+        files_found = {}  # ordered set, a file can match more than one of the plugin's regexes
+        log_parts.append(f'<b>For {plugin.name} module</b>')
+        for artifact_search_regex in plugin.search_regexes:
+            found = search_results[artifact_search_regex]
             if not found:
-                log.write(f'<ul><li>No file found for regex <i>{artifact_search_regex}</i></li></ul>')
+                log_parts.append(f'<ul><li>No file found for regex <i>{artifact_search_regex}</i></li></ul>')
             else:
-                log.write(f'<ul><li>{len(found)} {"files" if len(found) > 1 else "file"} for regex <i>{artifact_search_regex}</i> located at:')
-                for pathh in found:
-                    if pathh.startswith('\\\\?\\'):
-                        pathh = pathh[4:]
-                    log.write(f'<ul><li>{pathh}</li></ul>')
-                log.write(f'</li></ul>')
-                files_found.extend(found)
+                log_parts.append(f'<ul><li>{len(found)} {"files" if len(found) > 1 else "file"} for regex <i>{artifact_search_regex}</i> located at:')
+                found_paths = map(strip_long_path_prefix, found) if strip_long_paths else found
+                log_parts.append(open_li)
+                log_parts.append(between_li.join(found_paths))
+                log_parts.append(close_li)
+                log_parts.append(close_li)
+                files_found.update(dict.fromkeys(found))
         if files_found:
-            logfunc()
-            logfunc('{} [{}] artifact started'.format(plugin.name, plugin.module_name))
-            category_folder = os.path.join(out_params.report_folder_base, plugin.category)
-            if not os.path.exists(category_folder):
-                try:
-                    os.mkdir(category_folder)
-                except (FileExistsError, FileNotFoundError) as ex:
-                    logfunc('Error creating {} report directory at path {}'.format(plugin.name, category_folder))
-                    logfunc('Error was {}'.format(str(ex)))
-                    continue  # cannot do work
-            try:
-                plugin.method(files_found, category_folder, seeker, wrap_text)
-            except Exception as ex:
-                logfunc('Reading {} artifact had errors!'.format(plugin.name))
-                logfunc('Error was {}'.format(str(ex)))
-                logfunc('Exception Traceback: {}'.format(traceback.format_exc()))
-                continue  # nope
-
-            logfunc('{} [{}] artifact completed'.format(plugin.name, plugin.module_name))
-
-    log.close()
+            plugin_jobs.append((plugin, list(files_found), category_folders[plugin.category]))
+        else:
+            parsed_modules += 1
+            GuiWindow.SetProgressBar(parsed_modules, len(plugins))
+
+    # Create the report folder of each category with work to do, once per category
+    failed_category_folders = set()
+    for category_folder in {category_folder for _, _, category_folder in plugin_jobs}:
+        try:
+            os.makedirs(category_folder, exist_ok=True)
+        except OSError as ex:
+            logfunc('Error creating report directory at path {}'.format(category_folder))
+            logfunc('Error was {}'.format(str(ex)))
+            failed_category_folders.add(category_folder)
+    if failed_category_folders:
+        for plugin, _, category_folder in plugin_jobs:
+            if category_folder in failed_category_folders:
+                logfunc('Skipping {} artifact, its report directory could not be created'.format(plugin.name))
+                parsed_modules += 1
+                GuiWindow.SetProgressBar(parsed_modules, len(plugins))
+        plugin_jobs = [job for job in plugin_jobs if job[2] not in failed_category_folders]
+
+    with open(os.path.join(out_params.report_folder_base, 'Script Logs', 'ProcessedFilesLog.html'), 'w', encoding='utf8') as log:
+        log.write(''.join(log_parts))
+
+    # Run the plugins which found files
+    failed_plugins = []
+    for plugin_name, log_entries, status in _run_plugins(plugin_jobs, seeker, wrap_text):
+        parsed_modules += 1
+        GuiWindow.SetProgressBar(parsed_modules, len(plugins))
+        for log_entry in log_entries:
+            logfunc(log_entry)
+        if not status:
+            failed_plugins.append(plugin_name)
 
     logfunc('')
     logfunc('Processes completed.')
-    end = process_time()
-    end_wall = perf_counter()
-    run_time_secs = end - start
+    if failed_plugins:
+        logfunc('{} artifact(s) had errors: {}'.format(len(failed_plugins), ', '.join(failed_plugins)))
+    # wall clock time, most of the processing is spent waiting on I/O which process_time() does not count
+    run_time_secs = (perf_counter_ns() - start) / 1_000_000_000
     run_time_HMS = strftime('%H:%M:%S', gmtime(run_time_secs))
     logfunc("Processing time = {}".format(run_time_HMS))
-    run_time_secs =  end_wall - start_wall
-    run_time_HMS = strftime('%H:%M:%S', gmtime(run_time_secs))
-    logfunc("Processing time (wall)= {}".format(run_time_HMS))
 
     logfunc('')
     logfunc('Report generation started.')
     # remove the \\?\ prefix we added to input and output paths, so it does not reflect in report
-    if is_platform_windows(): 
-        if out_params.report_folder_base.startswith('\\\\?\\'):
-            out_params.report_folder_base = out_params.report_folder_base[4:]
-        if input_path.startswith('\\\\?\\'):
-            input_path = input_path[4:]
+    out_params.report_folder_base = strip_long_path_prefix(out_params.report_folder_base)
+    input_path = strip_long_path_prefix(input_path)
     report.generate_report(out_params.report_folder_base, run_time_secs, run_time_HMS, extracttype, input_path, casedata)
     logfunc('Report generation Completed.')
     logfunc('')
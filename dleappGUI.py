@@ -161,9 +161,9 @@ def process(casedata):
 
         # File system extractions contain paths > 260 char, which causes problems
         # This fixes the problem by prefixing \\?\ on each windows path.
-        if is_platform_windows():
-            if input_path[1] == ':' and extracttype =='fs': input_path = '\\\\?\\' + input_path.replace('/', '\\')
-            if output_folder[1] == ':': output_folder = '\\\\?\\' + output_folder.replace('/', '\\')
+        if extracttype == 'fs':
+            input_path = add_long_path_prefix(input_path)
+        output_folder = add_long_path_prefix(output_folder)
 
         # re-create modules list based on user selection
         selected_modules = get_selected_modules()
@@ -186,8 +186,7 @@ def process(casedata):
 
         if crunch_successful:
             report_path = os.path.join(out_params.report_folder_base, 'index.html')
-            if report_path.startswith('\\\\?\\'): # windows
-                report_path = report_path[4:]
+            report_path = strip_long_path_prefix(report_path) # windows
             if report_path.startswith('\\\\'): # UNC path
                 report_path = report_path[2:]
             progress_bar.grid_remove()
@@ -195,8 +194,7 @@ def process(casedata):
             open_report_button.grid(ipadx=8)
         else:
             log_path = out_params.screen_output_file_path
-            if log_path.startswith('\\\\?\\'): # windows
-                log_path = log_path[4:]
+            log_path = strip_long_path_prefix(log_path) # windows
             tk_msgbox.showerror(
                 title='Error', 
                 message=f'Processing failed  :( \nSee log for error details..\nLog file located at {log_path}', 
@@ -1,5 +1,8 @@
+import ast
 import pathlib
 import dataclasses
+import functools
+import threading
 import typing
 import importlib.util
 
@@ -7,6 +10,9 @@ import importlib.util
 # a bit long-winded to make compatible with PyInstaller
 PLUGINPATH = pathlib.Path(__file__).resolve().parent / pathlib.Path("scripts/artifacts")
 
+# plugin modules can be imported from several threads, make sure each one is only executed once
+_load_module_lock = threading.Lock()
+
 
 @dataclasses.dataclass(frozen=True)
 class PluginSpec:
@@ -14,49 +20,143 @@ class PluginSpec:
     module_name: str
     category: str
     search: str
-    method: typing.Callable  # todo define callable signature
+    method_name: str
+    module_path: pathlib.Path
+    # entry point of plugins which had to be imported to read their __artifacts__
+    loaded_method: typing.Optional[typing.Callable] = dataclasses.field(default=None, repr=False, compare=False)
+    search_regexes: tuple[str, ...] = dataclasses.field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # search can be a single pattern or a list/tuple of them, normalized once here
+        search = self.search
+        search_regexes = tuple(search) if isinstance(search, (list, tuple)) else (search,)
+        object.__setattr__(self, "search_regexes", search_regexes)
+
+    @functools.cached_property
+    def method(self) -> typing.Callable:  # todo define callable signature
+        if self.loaded_method is not None:
+            return self.loaded_method
+        # the plugin module is only imported the first time its entry point is needed
+        mod = PluginLoader.load_module(self.module_path)
+        return getattr(mod, self.method_name)
 
 
 class PluginLoader:
     def __init__(self, plugin_path: typing.Optional[pathlib.Path] = None):
         self._plugin_path = plugin_path or PLUGINPATH
         self._plugins: dict[str, PluginSpec] = {}
-        self._load_plugins()
+        self._plugins_loaded = False  # manifests are only read on first use
+        self._plugins_lock = threading.Lock()
 
     @staticmethod
-    def load_module_lazy(path: pathlib.Path):
+    def _module_from_file(path: pathlib.Path, lazy: bool = False):
         spec = importlib.util.spec_from_file_location(path.stem, path)
-        loader = importlib.util.LazyLoader(spec.loader)
-        spec.loader = loader
+        if lazy:
+            spec.loader = importlib.util.LazyLoader(spec.loader)
         mod = importlib.util.module_from_spec(spec)
-        loader.exec_module(mod)
+        spec.loader.exec_module(mod)
         return mod
 
-    def _load_plugins(self):
-        for py_file in self._plugin_path.glob("*.py"):
-            mod = PluginLoader.load_module_lazy(py_file)
+    @staticmethod
+    def load_module_lazy(path: pathlib.Path):
+        # the module code only runs on first attribute access, used by the PyInstaller hook
+        return PluginLoader._module_from_file(path, lazy=True)
+
+    @staticmethod
+    def load_module(path: pathlib.Path):
+        with _load_module_lock:
+            return PluginLoader._load_module_cached(path)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _load_module_cached(path: pathlib.Path):
+        # not lazy: the module code has to run here, under _load_module_lock
+        return PluginLoader._module_from_file(path)
+
+    @staticmethod
+    def read_artifacts_manifest(path: pathlib.Path):
+        '''Reads the __artifacts__ of a plugin from its source without executing it.
+        Returns a dict {name: (category, search, function name)}, or None if __artifacts__
+        is not a plain literal (in which case the module has to be executed to read it)'''
+        tree = ast.parse(path.read_bytes(), filename=str(path))
+        for node in tree.body:
+            if isinstance(node, ast.Assign):
+                targets = node.targets
+            elif isinstance(node, ast.AnnAssign):
+                targets = [node.target]
+            else:
+                continue
+            if not any(isinstance(target, ast.Name) and target.id == "__artifacts__" for target in targets):
+                continue
+            if not isinstance(node.value, ast.Dict):
+                return None
+
+            manifest = {}
             try:
-                mod_artifacts = mod.__artifacts__
-            except AttributeError:
-                continue  # no artifacts defined in this plugin
+                for key, value in zip(node.value.keys, node.value.values):
+                    if key is None or not isinstance(value, ast.Tuple) or len(value.elts) != 3:
+                        return None
+                    category, search, func = value.elts
+                    if not isinstance(func, ast.Name):
+                        return None
+                    manifest[ast.literal_eval(key)] = (ast.literal_eval(category), ast.literal_eval(search), func.id)
+            except ValueError:
+                return None
+            return manifest
+
+        return {}  # no artifacts defined in this plugin
 
-            for name, (category, search, func) in mod_artifacts.items():
+    def _load_plugins(self):
+        for py_file in self._plugin_path.glob("*.py"):
+            manifest = PluginLoader.read_artifacts_manifest(py_file)
+            if manifest is None:
+                # the module is executed anyway, keep its entry points as they are: they are not
+                # necessarily module attributes named after their __name__ (aliases, partials...)
+                mod = PluginLoader.load_module(py_file)
+                manifest = {name: (category, search, getattr(func, '__name__', ''), func)
+                            for name, (category, search, func) in mod.__artifacts__.items()}
+            else:
+                manifest = {name: (category, search, func_name, None)
+                            for name, (category, search, func_name) in manifest.items()}
+
+            for name, (category, search, func_name, func) in manifest.items():
                 #self._plugins.append(PluginSpec(name, search, func))
                 if name in self._plugins:
                     raise KeyError("Duplicate plugin")
-                self._plugins[name] = PluginSpec(name, py_file.stem, category, search, func)
+                self._plugins[name] = PluginSpec(name, py_file.stem, category, search, func_name, py_file, func)
+
+    def _ensure_plugins_loaded(self):
+        with self._plugins_lock:
+            if not self._plugins_loaded:
+                self._load_plugins()
+                self._plugins_loaded = True
+
+    def iter_specs(self) -> typing.Iterator[PluginSpec]:
+        self._ensure_plugins_loaded()
+        yield from self._plugins.values()
 
     @property
     def plugins(self) -> typing.Iterable[PluginSpec]:
-        yield from self._plugins.values()
+        yield from self.iter_specs()
+
+    def plugins_filtered(self, names: typing.Optional[typing.Iterable[str]] = None) -> typing.Iterable[PluginSpec]:
+        '''Yields the plugins whose name is in names, or all plugins if names is None'''
+        if names is None:
+            yield from self.iter_specs()
+            return
+        names = set(names)
+        yield from (plugin for plugin in self.iter_specs() if plugin.name in names)
 
     def __getitem__(self, item: str) -> PluginSpec:
+        self._ensure_plugins_loaded()
         return self._plugins[item]
 
     def __contains__(self, item):
+        self._ensure_plugins_loaded()
         return item in self._plugins
 
     def __len__(self):
+        self._ensure_plugins_loaded()
         return len(self._plugins)
 
 
@@ -8,6 +8,7 @@ import shutil
 import json
 import sqlite3
 import sys
+import threading
 from functools import lru_cache
 from pathlib import Path
 from typing import Pattern
@@ -20,6 +21,13 @@ from scripts.filetype import guess_mime
 
 os.path.basename = lru_cache(maxsize=None)(os.path.basename)
 
+# plugins can run in parallel threads, the exports they share (TSV folder, timeline and KML
+# databases, usernames and IP addresses databases) are written by one thread at a time
+_shared_exports_lock = threading.Lock()
+
+# logfunc messages kept per thread, see start_log_buffering()
+_log_buffer = threading.local()
+
 
 class OutputParameters:
     '''Defines the parameters that are common for '''
@@ -57,6 +65,24 @@ def is_platform_windows():
     return sys.platform == 'win32'
 
 
+def add_long_path_prefix(path):
+    r'''Returns the absolute path, prefixed with \\?\ on Windows (for drive letter paths) so
+       that paths > 260 chars can be used. Other platforms get the path back unchanged.
+    '''
+    if not is_platform_windows():
+        return path
+    # abspath, not resolve(): mapped drives must not become UNC paths, nor links be followed
+    path = os.path.abspath(path)
+    if path[1:2] == ':':
+        path = '\\\\?\\' + path
+    return path
+
+
+def strip_long_path_prefix(path):
+    r'''Removes the \\?\ prefix added by add_long_path_prefix(), eg: for paths shown in the report'''
+    return path.removeprefix('\\\\?\\')
+
+
 def sanitize_file_path(filename, replacement_char='_'):
     '''
     Removes illegal characters (for windows) from the string passed. Does not replace \ or /
@@ -147,7 +173,25 @@ class GuiWindow:
             progress_bar.config(value=n)
 
 
+def start_log_buffering():
+    '''Keeps the logfunc messages of the current thread, instead of writing them,
+       until stop_log_buffering() is called'''
+    _log_buffer.messages = []
+
+
+def stop_log_buffering():
+    '''Returns the logfunc messages kept for the current thread and stops keeping them'''
+    messages = getattr(_log_buffer, 'messages', None) or []
+    _log_buffer.messages = None
+    return messages
+
+
 def logfunc(message=""):
+    messages = getattr(_log_buffer, 'messages', None)
+    if messages is not None:
+        messages.append(message)
+        return
+
     def redirect_logs(string):
         log_text.insert('end', string)
         log_text.see('end')
@@ -219,6 +263,11 @@ def html2csv(reportfolderbase):
 
 
 def tsv(report_folder, data_headers, data_list, tsvname, source_file=None):
+    with _shared_exports_lock:
+        _tsv(report_folder, data_headers, data_list, tsvname, source_file)
+
+
+def _tsv(report_folder, data_headers, data_list, tsvname, source_file=None):
     report_folder = report_folder.rstrip('/')
     report_folder = report_folder.rstrip('\\')
     report_folder_base, tail = os.path.split(report_folder)
@@ -227,7 +276,7 @@ def tsv(report_folder, data_headers, data_list, tsvname, source_file=None):
     if os.path.isdir(tsv_report_folder):
         pass
     else:
-        os.makedirs(tsv_report_folder)
+        os.makedirs(tsv_report_folder, exist_ok=True)
 
     if os.path.exists(os.path.join(tsv_report_folder, tsvname + '.tsv')):
         with codecs.open(os.path.join(tsv_report_folder, tsvname + '.tsv'), 'a') as tsvfile:
@@ -257,6 +306,11 @@ def tsv(report_folder, data_headers, data_list, tsvname, source_file=None):
 
 
 def timeline(report_folder, tlactivity, data_list, data_headers):
+    with _shared_exports_lock:
+        _timeline(report_folder, tlactivity, data_list, data_headers)
+
+
+def _timeline(report_folder, tlactivity, data_list, data_headers):
     report_folder = report_folder.rstrip('/')
     report_folder = report_folder.rstrip('\\')
     report_folder_base, tail = os.path.split(report_folder)
@@ -269,14 +323,14 @@ def timeline(report_folder, tlactivity, data_list, data_headers):
         cursor.execute('''PRAGMA synchronous = EXTRA''')
         cursor.execute('''PRAGMA journal_mode = WAL''')
     else:
-        os.makedirs(tl_report_folder)
+        os.makedirs(tl_report_folder, exist_ok=True)
         # create database
         tldb = os.path.join(tl_report_folder, 'tl.db')
         db = sqlite3.connect(tldb, isolation_level='exclusive')
         cursor = db.cursor()
         cursor.execute(
             """
-        CREATE TABLE data(key TEXT, activity TEXT, datalist TEXT)
+        CREATE TABLE IF NOT EXISTS data(key TEXT, activity TEXT, datalist TEXT)
         """
         )
         db.commit()
@@ -292,6 +346,11 @@ def timeline(report_folder, tlactivity, data_list, data_headers):
 
 
 def kmlgen(report_folder, kmlactivity, data_list, data_headers):
+    with _shared_exports_lock:
+        _kmlgen(report_folder, kmlactivity, data_list, data_headers)
+
+
+def _kmlgen(report_folder, kmlactivity, data_list, data_headers):
     report_folder = report_folder.rstrip('/')
     report_folder = report_folder.rstrip('\\')
     report_folder_base, tail = os.path.split(report_folder)
@@ -305,13 +364,13 @@ def kmlgen(report_folder, kmlactivity, data_list, data_headers):
         cursor.execute('''PRAGMA journal_mode = WAL''')
         db.commit()
     else:
-        os.makedirs(kml_report_folder)
+        os.makedirs(kml_report_folder, exist_ok=True)
         latlongdb = os.path.join(kml_report_folder, '_latlong.db')
         db = sqlite3.connect(latlongdb)
         cursor = db.cursor()
         cursor.execute(
             """
-        CREATE TABLE data(key TEXT, latitude TEXT, longitude TEXT, activity TEXT)
+        CREATE TABLE IF NOT EXISTS data(key TEXT, latitude TEXT, longitude TEXT, activity TEXT)
         """
         )
         db.commit()
@@ -475,6 +534,11 @@ def media_to_html(media_path, files_found, report_folder):
 
 
 def usergen(report_folder, data_list_usernames):
+    with _shared_exports_lock:
+        _usergen(report_folder, data_list_usernames)
+
+
+def _usergen(report_folder, data_list_usernames):
     report_folder = report_folder.rstrip('/')
     report_folder = report_folder.rstrip('\\')
     report_folder_base, tail = os.path.split(report_folder)
@@ -488,13 +552,13 @@ def usergen(report_folder, data_list_usernames):
         cursor.execute('''PRAGMA journal_mode = WAL''')
         db.commit()
     else:
-        os.makedirs(udb_report_folder)
+        os.makedirs(udb_report_folder, exist_ok=True)
         usernames = os.path.join(udb_report_folder, '_usernames.db')
         db = sqlite3.connect(usernames)
         cursor = db.cursor()
         cursor.execute(
             """
-            CREATE TABLE data(username TEXT, appname TEXT, artifactname text, html_report text, data TEXT)
+            CREATE TABLE IF NOT EXISTS data(username TEXT, appname TEXT, artifactname text, html_report text, data TEXT)
             """
         )
         db.commit()
@@ -514,6 +578,11 @@ def usergen(report_folder, data_list_usernames):
 
 
 def ipgen(report_folder, data_list_ipaddress):
+    with _shared_exports_lock:
+        _ipgen(report_folder, data_list_ipaddress)
+
+
+def _ipgen(report_folder, data_list_ipaddress):
     report_folder = report_folder.rstrip('/')
     report_folder = report_folder.rstrip('\\')
     report_folder_base, tail = os.path.split(report_folder)
@@ -527,13 +596,13 @@ def ipgen(report_folder, data_list_ipaddress):
         cursor.execute('''PRAGMA journal_mode = WAL''')
         db.commit()
     else:
-        os.makedirs(udb_report_folder)
+        os.makedirs(udb_report_folder, exist_ok=True)
         ipaddress = os.path.join(udb_report_folder, '_ipaddresses.db')
         db = sqlite3.connect(ipaddress)
         cursor = db.cursor()
         cursor.execute(
             """
-            CREATE TABLE data(ipaddress TEXT, appname TEXT, artifactname text, html_report text, data TEXT)
+            CREATE TABLE IF NOT EXISTS data(ipaddress TEXT, appname TEXT, artifactname text, html_report text, data TEXT)
             """
         )
         db.commit()
@@ -17,6 +17,10 @@ class FileSeekerBase:
         '''Returns a list of paths for files/folders that matched'''
         pass
 
+    def search_many(self, filepatterns):
+        '''Returns a dict {pattern: list of paths} for each of the patterns'''
+        return {filepattern: self.search(filepattern) for filepattern in filepatterns}
+
     def cleanup(self):
         '''close any open handles'''
         pass
@@ -28,6 +32,9 @@ class FileSeekerDir(FileSeekerBase):
         self._all_files = []
         logfunc('Building files listing...')
         self.build_files_list(directory)
+        # paths as they are matched against the patterns, computed once for all searches
+        root = normcase("root/")
+        self._search_index = [root + normcase(item) for item in self._all_files]
         logfunc(f'File listing complete - {len(self._all_files)} files')
 
     def build_files_list(self, directory):
@@ -43,17 +50,22 @@ class FileSeekerDir(FileSeekerBase):
 
     def search(self, filepattern, return_on_first_hit=False):
         pat = _compile_pattern( normcase(filepattern) )
-        root = normcase("root/")
         if return_on_first_hit:
-            for item in self._all_files:
-                if pat( root + normcase(item) ) is not None:
+            for search_item, item in zip(self._search_index, self._all_files):
+                if pat(search_item) is not None:
                     return [item]
             return []
-        pathlist = []
-        for item in self._all_files:
-            if pat( root + normcase(item) ) is not None:
-                pathlist.append(item)
-        return pathlist
+        return [item for search_item, item in zip(self._search_index, self._all_files) if pat(search_item) is not None]
+
+    def search_many(self, filepatterns):
+        '''Matches all the patterns in a single pass over the files listing'''
+        pats = [(filepattern, _compile_pattern( normcase(filepattern) )) for filepattern in dict.fromkeys(filepatterns)]
+        results = {filepattern: [] for filepattern, _ in pats}
+        for search_item, item in zip(self._search_index, self._all_files):
+            for filepattern, pat in pats:
+                if pat(search_item) is not None:
+                    results[filepattern].append(item)
+        return results
 
 class FileSeekerTar(FileSeekerBase):
     def __init__(self, tar_file_path, temp_folder):
@@ -96,15 +108,16 @@ class FileSeekerZip(FileSeekerBase):
         FileSeekerBase.__init__(self)
         self.zip_file = ZipFile(zip_file_path)
         self.name_list = self.zip_file.namelist()
+        root = normcase("root/")
+        self._search_index = [root + normcase(member) for member in self.name_list]
         self.temp_folder = temp_folder
         self.directory = temp_folder
 
     def search(self, filepattern, return_on_first_hit=False):
         pathlist = []
         pat = _compile_pattern( normcase(filepattern) )
-        root = normcase("root/")
-        for member in self.name_list:
-            if pat( root + normcase(member) ) is not None:
+        for search_item, member in zip(self._search_index, self.name_list):
+            if pat(search_item) is not None:
                 try:
                     extracted_path = self.zip_file.extract(member, path=self.temp_folder) # already replaces illegal chars with _ when exporting
                     f = self.zip_file.getinfo(member)